@@ -1,8 +1,220 @@
 import sys
 import os
+import io
+import hashlib
+import shutil
 import subprocess
+import wave
 from pathlib import Path
 
+# --- Piper TTS Configuration (using amy-medium) ---
+MODEL_NAME = "en_US-amy-medium"
+# Absolute path for the models directory, consistent with the Dockerfile
+MODELS_DIR = Path("/home/manim/piper_models")
+MODEL_PATH = MODELS_DIR / f"{MODEL_NAME}.onnx"
+MODEL_CONFIG_PATH = MODELS_DIR / f"{MODEL_NAME}.onnx.json"
+
+# On-disk cache of synthesized audio so regenerated scenes with identical
+# narration skip the model entirely.
+CACHE_DIR = Path("/home/manim/piper_cache")
+
+# 1 MiB pipe buffer for subprocesses moving audio bytes - keeps syscall
+# counts low on multi-MB WAV payloads.
+PIPE_BUFSIZE = 1 << 20
+
+# RAM-backed staging area for the voice model; loading the ~60MB ONNX file
+# from tmpfs cuts cold-start load time noticeably versus disk.
+SHM_MODELS_DIR = Path("/dev/shm/piper_models")
+
+
+def _fadvise_willneed(path):
+    """Hint the kernel to read the file ahead of Piper opening it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, os.fstat(fd).st_size, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except (OSError, AttributeError):
+        pass
+
+
+def _warm_model_files(model_path, config_path):
+    """Stage the voice model on tmpfs, returning the paths Piper should load."""
+    try:
+        os.makedirs(SHM_MODELS_DIR, exist_ok=True)
+        for src in (model_path, config_path):
+            dst = SHM_MODELS_DIR / src.name
+            if not dst.is_file() or dst.stat().st_size != src.stat().st_size:
+                tmp_path = str(dst) + ".tmp"
+                shutil.copyfile(src, tmp_path)
+                os.replace(tmp_path, dst)
+        warm_model = SHM_MODELS_DIR / model_path.name
+        _fadvise_willneed(warm_model)
+        return warm_model, SHM_MODELS_DIR / config_path.name
+    except OSError as e:
+        # tmpfs unavailable (or full): load straight from disk as before.
+        print(f"Warning: could not stage model in {SHM_MODELS_DIR}: {e}", file=sys.stderr)
+        _fadvise_willneed(model_path)
+        return model_path, config_path
+
+
+class _PiperWorker:
+    """Holds a loaded Piper voice so repeated calls skip the ~3-4s model load."""
+
+    def __init__(self, model_path, config_path):
+        from piper.voice import PiperVoice
+        self.voice = PiperVoice.load(str(model_path), config_path=str(config_path))
+        # piper-tts 1.3+ renamed the wave-writer form to synthesize_wav
+        # and repurposed synthesize() to return audio chunks; on <=1.2 the
+        # wave-writer form is synthesize() itself.
+        self._synthesize_wav = getattr(self.voice, 'synthesize_wav', self.voice.synthesize)
+
+    def synthesize_to_wav(self, text, wav_path):
+        with wave.open(wav_path, 'wb') as wav_file:
+            self._synthesize_wav(text, wav_file)
+
+    def synthesize_to_wav_bytes(self, text):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav_file:
+            self._synthesize_wav(text, wav_file)
+        return buffer.getvalue()
+
+
+_worker = None
+
+def _get_worker(model_path, config_path):
+    """Lazily create the singleton Piper worker, keeping the model warm."""
+    global _worker
+    if _worker is None:
+        _worker = _PiperWorker(model_path, config_path)
+    return _worker
+
+
+def _require_model():
+    """Fail fast if the pre-downloaded voice model is missing.
+
+    Models must be baked into the image (see worker.DockerFile) - fetching
+    hundreds of MB mid-request is never acceptable on the hot path.
+    """
+    for path in (MODEL_PATH, MODEL_CONFIG_PATH):
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"Piper voice model file missing: {path}. "
+                f"Pre-download '{MODEL_NAME}' at image build time."
+            )
+
+
+# Validate once at import time instead of stat-ing the model on every call.
+_require_model()
+
+
+def _cache_path(text, voice, suffix):
+    """Cache file path for a (voice, text) pair, keyed by a stable hash."""
+    key = hashlib.blake2b((voice + "\0" + text).encode('utf-8'), digest_size=16).hexdigest()
+    return CACHE_DIR / f"{key}{suffix}"
+
+
+def _break_hardlink(path):
+    """Unlink path so subsequent writes can't rewrite a shared cache inode."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _deliver(src, dst):
+    """Materialize src at dst as cheaply as possible.
+
+    A hardlink moves zero bytes; when that fails (cross-device,
+    unsupported fs) shutil.copyfile stays in-kernel via sendfile. dst is
+    unlinked first: it may itself be a hardlink from an earlier delivery,
+    and copying onto it in place would corrupt that cache entry.
+    """
+    _break_hardlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _cached_tts(text, voice, output_path):
+    """Serve a previously synthesized clip from the cache. Returns True on a hit."""
+    cached = _cache_path(text, voice, Path(output_path).suffix)
+    if not cached.is_file():
+        return False
+    _deliver(cached, output_path)
+    return True
+
+
+def _store_in_cache(output_path, text, voice):
+    """Copy a freshly synthesized clip into the cache (atomic via os.replace)."""
+    try:
+        cached = _cache_path(text, voice, Path(output_path).suffix)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = str(cached) + ".tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, cached)
+    except OSError as e:
+        # Cache population is best-effort; the output itself is already written.
+        print(f"Warning: could not cache audio: {e}", file=sys.stderr)
+
+
+def _ffmpeg_mp3_command(output_path):
+    """ffmpeg command that encodes a WAV stream on stdin to MP3."""
+    return [
+        'ffmpeg', '-y', '-f', 'wav', '-i', 'pipe:0',
+        '-acodec', 'libmp3lame', '-b:a', '128k', output_path
+    ]
+
+
+def _ffmpeg_mux_command(video_path, output_path):
+    """ffmpeg command that muxes a WAV stream on stdin into a video."""
+    return [
+        'ffmpeg', '-y',
+        '-i', video_path,
+        '-f', 'wav', '-i', 'pipe:0',
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy', '-c:a', 'aac', '-b:a', '128k',
+        '-shortest', output_path
+    ]
+
+
+def _feed_ffmpeg(wav_bytes, ffmpeg_command):
+    """Run an ffmpeg command fed with in-memory WAV bytes on stdin."""
+    process = subprocess.Popen(
+        ffmpeg_command,
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        bufsize=PIPE_BUFSIZE
+    )
+    _, stderr = process.communicate(wav_bytes)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, 'ffmpeg', stderr=stderr)
+
+
+def _pipe_piper_to_ffmpeg(text, model_path, ffmpeg_command):
+    """CLI fallback: chain piper stdout directly into ffmpeg stdin."""
+    piper_process = subprocess.Popen(
+        ["piper", "--model", str(model_path), "--output_file", "-"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=PIPE_BUFSIZE
+    )
+    ffmpeg_process = subprocess.Popen(
+        ffmpeg_command,
+        stdin=piper_process.stdout, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        bufsize=PIPE_BUFSIZE
+    )
+    # Close our handle on piper's stdout so ffmpeg sees EOF when piper exits.
+    piper_process.stdout.close()
+    piper_process.stdin.write(text.encode('utf-8'))
+    piper_process.stdin.close()
+    _, stderr = ffmpeg_process.communicate()
+    piper_process.wait()
+    if piper_process.returncode != 0:
+        raise subprocess.CalledProcessError(piper_process.returncode, 'piper')
+    if ffmpeg_process.returncode != 0:
+        raise subprocess.CalledProcessError(ffmpeg_process.returncode, 'ffmpeg', stderr=stderr)
+
+
 def text_to_speech(text, output_path):
     """
     Convert text to speech using Piper TTS, prioritizing a pre-downloaded model.
@@ -12,74 +224,164 @@ def text_to_speech(text, output_path):
         output_path (str): Path where the audio file should be saved.
     """
     try:
-        # --- Piper TTS Configuration (using amy-medium) ---
-        model_name = "en_US-amy-medium"
-        # Absolute path for the models directory, consistent with the Dockerfile
-        models_dir = Path("/home/manim/piper_models")
-        model_path = models_dir / f"{model_name}.onnx"
-        model_config_path = models_dir / f"{model_name}.onnx.json"
-
-        # --- Check for Model (with fallback download) ---
-        if not model_path.is_file() or not model_config_path.is_file():
-            print(f"Warning: Pre-downloaded model '{model_name}' not found. Attempting to download...")
-            os.makedirs(models_dir, exist_ok=True)
-            
-            onnx_url = f"https://huggingface.co/rhasspy/piper-voices/resolve/main/{model_name}.onnx"
-            json_url = f"https://huggingface.co/rhasspy/piper-voices/resolve/main/{model_name}.onnx.json"
-
-            try:
-                subprocess.run(["curl", "--fail", "-L", "-o", str(model_path), onnx_url], check=True)
-                subprocess.run(["curl", "--fail", "-L", "-o", str(model_config_path), json_url], check=True)
-                print("Model downloaded successfully.")
-            except subprocess.CalledProcessError as e:
-                print(f"FATAL: Could not download the model. Error: {e}", file=sys.stderr)
-                sys.exit(1)
+        # --- Cache Check (skip synthesis entirely on repeats) ---
+        os.makedirs(Path(output_path).parent, exist_ok=True)
+        if _cached_tts(text, MODEL_NAME, output_path):
+            print(f"Cache hit - reusing previously synthesized audio at {output_path}")
+            return
 
         # --- Audio Generation ---
         output_dir = Path(output_path).parent
         os.makedirs(output_dir, exist_ok=True)
 
-        piper_executable = "piper"
-        wav_path = str(Path(output_path).with_suffix('.wav'))
-        
-        command = [piper_executable, "--model", str(model_path), "--output_file", wav_path]
+        # A previous cache hit may have hardlinked output_path into the
+        # cache; ffmpeg/wave truncate in place, so break the link before
+        # writing or the old entry's audio would be silently rewritten.
+        _break_hardlink(output_path)
 
-        print("Running Piper TTS command...")
-        subprocess.run(
-            command, input=text, text=True, capture_output=True, check=True, encoding='utf-8'
-        )
+        # Load the model from RAM-backed storage when possible.
+        model_path, model_config_path = _warm_model_files(MODEL_PATH, MODEL_CONFIG_PATH)
 
-        # --- Convert WAV to MP3 ---
         if output_path.endswith('.mp3'):
-            print(f"Converting {wav_path} to {output_path}...")
-            ffmpeg_command = [
-                'ffmpeg', '-y', '-i', wav_path, '-acodec', 'libmp3lame',
-                '-b:a', '128k', output_path
-            ]
-            subprocess.run(ffmpeg_command, check=True, capture_output=True)
-            os.remove(wav_path)
-            print(f"Successfully generated audio at {output_path}")
+            # WAV bytes flow straight from Piper into ffmpeg - no temp file.
+            print("Running Piper TTS (piped into ffmpeg)...")
+            try:
+                # Preferred path: synthesize in-process so the onnxruntime
+                # session stays resident between calls.
+                worker = _get_worker(model_path, model_config_path)
+                _feed_ffmpeg(worker.synthesize_to_wav_bytes(text), _ffmpeg_mp3_command(output_path))
+            except ImportError:
+                # piper python API unavailable: chain the CLI into ffmpeg.
+                _pipe_piper_to_ffmpeg(text, model_path, _ffmpeg_mp3_command(output_path))
         else:
-            print(f"Successfully generated audio at {wav_path}")
+            print("Running Piper TTS...")
+            try:
+                worker = _get_worker(model_path, model_config_path)
+                worker.synthesize_to_wav(text, output_path)
+            except ImportError:
+                command = ["piper", "--model", str(model_path), "--output_file", output_path]
+                subprocess.run(
+                    command, input=text, text=True, capture_output=True, check=True, encoding='utf-8'
+                )
+
+        _store_in_cache(output_path, text, MODEL_NAME)
+        print(f"Successfully generated audio at {output_path}")
 
     except subprocess.CalledProcessError as e:
+        stderr = e.stderr or b''
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('utf-8', errors='ignore')
         print(f"Error during audio generation: {e}", file=sys.stderr)
-        print(f"Stderr: {e.stderr.decode('utf-8', errors='ignore')}", file=sys.stderr)
+        print(f"Stderr: {stderr}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def generate_and_merge(text, video_path, output_path):
+    """
+    Synthesize narration and mux it straight into a video in one hop.
+
+    The audio goes Piper WAV -> AAC inside a single ffmpeg invocation with
+    the video stream copied, skipping the intermediate MP3 encode/decode
+    the separate generate-then-merge flow pays.
+
+    Args:
+        text (str): Text to convert to speech.
+        video_path (str): Video to attach the narration to.
+        output_path (str): Path for the merged output container.
+    """
+    try:
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"File not found: {video_path}")
+
+        os.makedirs(Path(output_path).parent, exist_ok=True)
+        model_path, model_config_path = _warm_model_files(MODEL_PATH, MODEL_CONFIG_PATH)
+
+        print("Running Piper TTS (muxed straight into video)...")
+        mux_command = _ffmpeg_mux_command(video_path, output_path)
+        try:
+            worker = _get_worker(model_path, model_config_path)
+            _feed_ffmpeg(worker.synthesize_to_wav_bytes(text), mux_command)
+        except ImportError:
+            _pipe_piper_to_ffmpeg(text, model_path, mux_command)
+
+        print(f"Successfully generated merged video at {output_path}")
+
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr or b''
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('utf-8', errors='ignore')
+        print(f"Error during generate-and-merge: {e}", file=sys.stderr)
+        print(f"Stderr: {stderr}", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
         sys.exit(1)
 
+
+def _tts_job(pair):
+    """Pool worker: synthesize one (text, output_path) pair, never raising."""
+    text, output_path = pair
+    try:
+        text_to_speech(text, output_path)
+        return output_path, None
+    except (Exception, SystemExit) as e:
+        return output_path, str(e)
+
+
+def batch_text_to_speech(pairs):
+    """
+    Synthesize many (text, output_path) pairs in parallel.
+
+    Each clip is data-independent, so the batch fans out across a process
+    pool sized to the machine. Returns True if every clip succeeded.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    failures = []
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for output_path, error in pool.map(_tts_job, pairs):
+            if error:
+                failures.append(output_path)
+                print(f"Failed: {output_path}: {error}", file=sys.stderr)
+            else:
+                print(f"Done: {output_path}")
+
+    print(f"Batch complete: {len(pairs) - len(failures)}/{len(pairs)} succeeded")
+    return not failures
+
+
+def _run_batch(manifest_path):
+    import json
+    with open(manifest_path) as f:
+        entries = json.load(f)
+    pairs = [(entry['text'], entry['output']) for entry in entries]
+    sys.exit(0 if batch_text_to_speech(pairs) else 1)
+
+
 if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--batch":
+        _run_batch(sys.argv[2])
+
+    if len(sys.argv) == 5 and sys.argv[1] == "--merge":
+        if not sys.argv[2].strip():
+            print("Error: Text content cannot be empty", file=sys.stderr)
+            sys.exit(1)
+        generate_and_merge(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit(0)
+
     if len(sys.argv) != 3:
         print("Usage: python generate_audio.py <text> <output_path>", file=sys.stderr)
+        print("       python generate_audio.py --batch <manifest.json>", file=sys.stderr)
+        print("       python generate_audio.py --merge <text> <video> <output_path>", file=sys.stderr)
         sys.exit(1)
-    
+
     text_content = sys.argv[1]
     file_path = sys.argv[2]
-    
+
     if not text_content.strip():
         print("Error: Text content cannot be empty", file=sys.stderr)
         sys.exit(1)
-        
+
     text_to_speech(text_content, file_path)
\ No newline at end of file
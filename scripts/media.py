@@ -0,0 +1,32 @@
+"""
+Single entry point for the worker's media operations.
+
+Earlier revisions carried parallel pyttsx3/moviepy variants of the audio
+and merge scripts; those are gone, and this module is the one import path
+callers should use so they all share the warm Piper worker, the TTS
+cache, and the stream-copy merger.
+"""
+
+from generate_audio import (
+    text_to_speech,
+    generate_and_merge,
+    batch_text_to_speech,
+)
+from merge_media import (
+    merge_audio_video,
+    get_media_duration,
+    batch_sync_media,
+    MediaSyncer,
+    SyncMethod,
+)
+
+
+def tts(text, output_path):
+    """Synthesize narration to output_path (MP3 or WAV by extension)."""
+    text_to_speech(text, output_path)
+    return output_path
+
+
+def merge(video_path, audio_path, output_path):
+    """Attach an audio track to a video by stream copy - no re-encode."""
+    return merge_audio_video(video_path, audio_path, output_path)